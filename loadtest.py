@@ -0,0 +1,397 @@
+"""HTTP（server.py）与 MCP（mcp_server.py）前端的压测工具。
+
+在进程内启动 FastAPI 服务，并把 script/wechat_sender.py 中的自动化步骤替换为
+按配置延迟阻塞的模拟后端（与真实 pywinauto 调用一样会阻塞事件循环），然后按给定
+并发与请求配比驱动 /send、/dump 或 MCP 工具调用，输出 JSON 结果便于跨版本对比。
+
+示例：
+    python loadtest.py --target http --concurrency 16 --requests 200 --mix send=8,dump=2
+    python loadtest.py --target mcp --latency attach=0.3,send=0.15 --output result.json
+"""
+import asyncio
+import json
+import random
+import socket
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import uvicorn
+
+from script import wechat_sender as ws
+
+DEFAULT_LATENCY = {
+    "ensure": 0.02,  # ensure_wechat_running
+    "attach": 0.3,  # attach_wechat（含聚焦后的等待）
+    "open_chat": 0.5,  # focus_search_and_open_chat
+    "send": 0.15,  # send_message_to_current_chat，每条消息
+    "dump": 0.05,  # main_win.descendants()
+}
+
+
+class _SimulatedWindow:
+    def __init__(self, latency: Dict[str, float], controls: int = 80):
+        self._latency = latency
+        self._controls = controls
+
+    def descendants(self, **criteria):
+        time.sleep(self._latency["dump"])
+        return [_SimulatedControl(i) for i in range(self._controls)]
+
+
+class _SimulatedControl:
+    class _Info:
+        def __init__(self, i: int):
+            self.control_type = "Text"
+            self.name = f"ctrl-{i}"
+            self.class_name = "SimulatedControl"
+
+    def __init__(self, i: int):
+        self.element_info = self._Info(i)
+
+
+class SimulatedBackend:
+    """用按配置延迟阻塞的函数替换 wechat_sender 的自动化步骤。"""
+
+    def __init__(self, latency: Dict[str, float]):
+        self.latency = latency
+        self._saved = {}
+
+    def install(self) -> None:
+        lat = self.latency
+        main_win = _SimulatedWindow(lat)
+
+        def ensure_wechat_running(start_if_needed: bool = True, timeout: float = 20.0) -> None:
+            time.sleep(lat["ensure"])
+
+        def attach_wechat(timeout: float = 20.0):
+            time.sleep(lat["attach"])
+            return None, main_win
+
+        def focus_search_and_open_chat(main_win, friend_name: str, delay: float = 0.25) -> None:
+            time.sleep(lat["open_chat"])
+
+        def send_message_to_current_chat(main_win, message: str, *args, **kwargs) -> None:
+            time.sleep(lat["send"])
+
+        replacements = {
+            "ensure_wechat_running": ensure_wechat_running,
+            "attach_wechat": attach_wechat,
+            "focus_search_and_open_chat": focus_search_and_open_chat,
+            "send_message_to_current_chat": send_message_to_current_chat,
+        }
+        for name, fn in replacements.items():
+            self._saved[name] = getattr(ws, name)
+            setattr(ws, name, fn)
+
+    def uninstall(self) -> None:
+        for name, fn in self._saved.items():
+            setattr(ws, name, fn)
+        self._saved.clear()
+
+    def service_time(self, kind: str, friends: int, messages: int, friend_delay: float) -> float:
+        """一次请求在模拟后端上的纯执行耗时（秒），用于从总延迟中扣除得到排队时间。"""
+        lat = self.latency
+        base = lat["ensure"] + lat["attach"]
+        if kind == "dump":
+            return base + lat["dump"]
+        return base + friends * (lat["open_chat"] + friend_delay + messages * lat["send"])
+
+
+class _ServerThread:
+    """在后台线程中运行 uvicorn，便于同进程压测。"""
+
+    def __init__(self, port: int):
+        import server
+
+        config = uvicorn.Config(server.app, host="127.0.0.1", port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        deadline = time.time() + 10.0
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("uvicorn 启动超时")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(10.0)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _parse_pairs(text: str, cast=float) -> Dict[str, float]:
+    out = {}
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        key, sep, value = part.partition("=")
+        key = key.strip()
+        if not key or not sep:
+            raise ValueError(f"格式应为 键=值：{part}")
+        try:
+            out[key] = cast(value)
+        except ValueError:
+            raise ValueError(f"{key} 的值不是数字：{value.strip()!r}")
+        if out[key] < 0:
+            raise ValueError(f"{key} 不能为负数：{value.strip()}")
+    return out
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def _summarize(samples: List[dict], elapsed: float) -> dict:
+    def _ms(v):
+        return None if v is None else round(v * 1000.0, 3)
+
+    ok = [s for s in samples if s["status"] == "ok"]
+    errors = sum(1 for s in samples if s["status"] == "error")
+    timeouts = sum(1 for s in samples if s["status"] == "timeout")
+    # 超时请求按其实际等待时长计入分位数，避免尾部延迟被低估；快速失败的错误请求不计入
+    timed = [s for s in samples if s["status"] in ("ok", "timeout")]
+    latencies = [s["latency"] for s in timed]
+    queue = [s["queue"] for s in timed]
+    total = len(samples)
+    return {
+        "requests": total,
+        "ok": len(ok),
+        "errors": errors,
+        "timeouts": timeouts,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "timeout_rate": round(timeouts / total, 4) if total else 0.0,
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": _ms(_percentile(latencies, 50)),
+            "p95": _ms(_percentile(latencies, 95)),
+            "p99": _ms(_percentile(latencies, 99)),
+            "max": _ms(max(latencies) if latencies else None),
+        },
+        "queue_ms": {
+            "p50": _ms(_percentile(queue, 50)),
+            "p95": _ms(_percentile(queue, 95)),
+            "p99": _ms(_percentile(queue, 99)),
+            "max": _ms(max(queue) if queue else None),
+        },
+    }
+
+
+class _ToolTimeout(Exception):
+    """MCP 工具调用失败且耗时已达到 mcp_server 的转发超时，视为超时。"""
+
+
+class LoadGenerator:
+    def __init__(self, cfg: dict, backend: SimulatedBackend, api_url: str):
+        self.cfg = cfg
+        self.backend = backend
+        self.api_url = api_url
+        kinds = [k for k, w in cfg["mix"].items() if w > 0]
+        weights = [cfg["mix"][k] for k in kinds]
+        rng = random.Random(cfg["seed"])
+        self.plan = [rng.choices(kinds, weights)[0] for _ in range(cfg["requests"])]
+        self.samples: List[dict] = []
+
+    def _payload(self, kind: str, seq: int) -> dict:
+        cfg = self.cfg
+        if kind == "dump":
+            return {"backend": "uia", "verbose": False}
+        return {
+            "friends": [f"loadtest-{seq}-{i}" for i in range(cfg["friends"])],
+            "messages": [f"message {i}" for i in range(cfg["messages"])],
+            "backend": "uia",
+            "friend_delay": cfg["friend_delay"],
+            "message_delay": 0.0,
+            "verbose": False,
+        }
+
+    async def _timed(self, kind: str, call) -> None:
+        cfg = self.cfg
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(call, timeout=cfg["timeout"])
+            status = "ok"
+        except (asyncio.TimeoutError, httpx.TimeoutException, _ToolTimeout):
+            status = "timeout"
+        except Exception:
+            status = "error"
+        latency = time.perf_counter() - start
+        service = self.backend.service_time(kind, cfg["friends"], cfg["messages"], cfg["friend_delay"])
+        self.samples.append({
+            "kind": kind,
+            "status": status,
+            "latency": latency,
+            "queue": max(0.0, latency - service),
+        })
+
+    async def _http_worker(self, queue: asyncio.Queue) -> None:
+        async with httpx.AsyncClient(timeout=None, trust_env=False) as client:
+            while True:
+                try:
+                    seq, kind = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                async def _call():
+                    resp = await client.post(f"{self.api_url}/{kind}", json=self._payload(kind, seq))
+                    resp.raise_for_status()
+
+                await self._timed(kind, _call())
+
+    async def _mcp_worker(self, queue: asyncio.Queue) -> None:
+        from fastmcp import Client
+        import mcp_server
+
+        async with Client(mcp_server.app) as client:
+            while True:
+                try:
+                    seq, kind = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                tool = "send_messages" if kind == "send" else "dump_controls"
+
+                async def _call():
+                    start = time.perf_counter()
+                    result = await client.call_tool(tool, self._payload(kind, seq))
+                    if getattr(result, "isError", False):
+                        # mcp_server 把 httpx 超时包装成工具错误（错误文本可能为空），按耗时判定
+                        if time.perf_counter() - start >= mcp_server.API_TIMEOUT:
+                            raise _ToolTimeout(tool)
+                        raise RuntimeError(f"{tool} 调用失败")
+
+                await self._timed(kind, _call())
+
+    async def run(self) -> dict:
+        queue: asyncio.Queue = asyncio.Queue()
+        for seq, kind in enumerate(self.plan):
+            queue.put_nowait((seq, kind))
+        if self.cfg["target"] == "mcp":
+            import logging
+            import mcp_server
+
+            # 压测时屏蔽 MCP / httpx 的逐请求 INFO 日志
+            for name in ("mcp", "fastmcp", "httpx"):
+                logging.getLogger(name).setLevel(logging.WARNING)
+            mcp_server.API_URL = self.api_url
+            # 让 mcp_server 转发请求的超时与压测超时一致，超时统一计入 timeouts
+            mcp_server.API_TIMEOUT = self.cfg["timeout"]
+            worker = self._mcp_worker
+        else:
+            worker = self._http_worker
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(queue) for _ in range(self.cfg["concurrency"])))
+        elapsed = time.perf_counter() - start
+
+        report = {
+            "config": self.cfg,
+            "latency_profile_s": self.backend.latency,
+            "elapsed_s": round(elapsed, 3),
+            "overall": _summarize(self.samples, elapsed),
+            "by_kind": {},
+        }
+        for kind in sorted(set(self.plan)):
+            report["by_kind"][kind] = _summarize([s for s in self.samples if s["kind"] == kind], elapsed)
+        return report
+
+
+def _parse_cli_args(argv: List[str]) -> dict:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="对 HTTP / MCP 前端进行并发压测（使用模拟自动化后端）")
+    parser.add_argument("--target", choices=["http", "mcp"], default="http", help="压测对象：http 直连 server.py，或经 mcp_server.py 转发")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发调用方数量")
+    parser.add_argument("--requests", type=int, default=100, help="总请求数")
+    parser.add_argument("--mix", type=str, default="send=8,dump=2", help="请求配比，例如 send=8,dump=2")
+    parser.add_argument("--friends", type=int, default=1, help="每个 /send 请求的好友数")
+    parser.add_argument("--messages", type=int, default=2, help="每个好友发送的消息数")
+    parser.add_argument("--friend-delay", type=float, default=0.0, help="请求中的 friend_delay（服务端真实 sleep）")
+    parser.add_argument(
+        "--latency",
+        type=str,
+        default="",
+        help="模拟各步骤耗时（秒），键：ensure/attach/open_chat/send/dump，例如 attach=0.3,send=0.15",
+    )
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个请求超时秒数")
+    parser.add_argument("--seed", type=int, default=0, help="请求配比随机种子")
+    parser.add_argument("--output", type=str, default="", help="结果 JSON 输出文件（默认打印到标准输出）")
+    args = parser.parse_args(argv)
+
+    latency = dict(DEFAULT_LATENCY)
+    try:
+        latency_overrides = _parse_pairs(args.latency)
+        mix = _parse_pairs(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+    for key, value in latency_overrides.items():
+        if key not in latency:
+            parser.error(f"未知的延迟步骤：{key}")
+        latency[key] = value
+    for key in mix:
+        if key not in ("send", "dump"):
+            parser.error(f"未知的请求类型：{key}")
+    if args.friends < 0 or args.messages < 0:
+        parser.error("--friends / --messages 不能为负数")
+    if args.friend_delay < 0:
+        parser.error("--friend-delay 不能为负数")
+    if args.timeout <= 0:
+        parser.error("--timeout 必须大于 0")
+    if not any(w > 0 for w in mix.values()):
+        parser.error("--mix 至少需要一种权重大于 0 的请求类型")
+    return {
+        "target": args.target,
+        "concurrency": max(1, args.concurrency),
+        "requests": max(1, args.requests),
+        "mix": mix,
+        "friends": args.friends,
+        "messages": args.messages,
+        "friend_delay": args.friend_delay,
+        "latency": latency,
+        "timeout": args.timeout,
+        "seed": args.seed,
+        "output": args.output,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    if argv is None:
+        argv = sys.argv[1:]
+    cfg = _parse_cli_args(argv)
+    ws._ensure_utf8_console()
+
+    backend = SimulatedBackend(cfg.pop("latency"))
+    output = cfg.pop("output")
+    backend.install()
+    try:
+        port = _free_port()
+        with _ServerThread(port):
+            report = asyncio.run(LoadGenerator(cfg, backend, f"http://127.0.0.1:{port}").run())
+    finally:
+        backend.uninstall()
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 import asyncio
 import json
 import os
-from typing import List
+from typing import List, Optional
 
 from fastmcp import FastMCP
 import httpx
 
 API_URL = os.environ.get("WEIXIN_API_URL", "http://127.0.0.1:8000")
+# 转发到 HTTP 服务的请求超时（秒）
+API_TIMEOUT = float(os.environ.get("WEIXIN_API_TIMEOUT", "60"))
 
 app = FastMCP(
     name="weixin-auto-sender",
@@ -39,7 +41,7 @@ async def send_messages(
     返回：JSON 结果
     """
     # 显式禁用系统代理环境（trust_env=False），避免 TUN/代理劫持本地请求
-    async with httpx.AsyncClient(timeout=60.0, trust_env=False) as client:
+    async with httpx.AsyncClient(timeout=API_TIMEOUT, trust_env=False) as client:
         resp = await client.post(
             f"{API_URL}/send",
             json={
@@ -60,14 +62,22 @@ async def send_messages(
 async def dump_controls(
     backend: str = "win32",
     verbose: bool = True,
+    snapshot_name: Optional[str] = None,
+    snapshot_label: str = "",
 ) -> dict:
-    """导出 Weixin 主窗口的前若干个控件信息（通过本地 HTTP 自动化服务）。"""
-    async with httpx.AsyncClient(timeout=60.0, trust_env=False) as client:
+    """导出 Weixin 主窗口的前若干个控件信息（通过本地 HTTP 自动化服务）。
+
+    指定 snapshot_name（仅文件名）时，服务端会同时把完整控件树录制为二进制快照文件，
+    保存在服务端的 WEIXIN_SNAPSHOT_DIR 目录下（不覆盖已有文件），便于离线回放。
+    """
+    async with httpx.AsyncClient(timeout=API_TIMEOUT, trust_env=False) as client:
         resp = await client.post(
             f"{API_URL}/dump",
             json={
                 "backend": backend,
                 "verbose": verbose,
+                "snapshot_name": snapshot_name,
+                "snapshot_label": snapshot_label,
             },
         )
         resp.raise_for_status()
@@ -0,0 +1,503 @@
+"""微信 UI 控件树快照：录制（Windows）与离线回放（任意平台）。
+
+快照文件为紧凑的二进制格式，可直接 mmap 后按下标随机读取：
+
+    [头部] [定长控件记录 * N] [字符串偏移表 (M + 1) * u32] [UTF-8 字符串区]
+
+控件按先序（与 descendants() 顺序一致）存放，每条记录保存父节点下标，
+顶层窗口的父节点为 -1。所有文本（类型/类名/名称/进程名/元数据 JSON）去重后
+放入字符串表，记录中仅存下标。
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+MAGIC = b"WXSN"
+VERSION = 1
+
+# magic, version, reserved, 控件数, 字符串数, 元数据字符串下标
+_HEADER = struct.Struct("<4sHHIII")
+# parent, flags, control_type, class_name, name, process_name, pid, handle, left, top, right, bottom
+_NODE = struct.Struct("<iIIIIIIQiiii")
+
+FLAG_TOP_WINDOW = 0x1  # 桌面顶层窗口
+FLAG_MAIN_WINDOW = 0x2  # 录制时选中的微信主窗口（其子树被完整录制）
+
+# 回放时 children()/descendants() 支持的过滤条件 -> 记录中的字段下标
+_FILTER_FIELDS = {"control_type": 2, "class_name": 3, "title": 4, "name": 4}
+_FILTER_REGEX_FIELDS = {"class_name_re": 3, "title_re": 4}
+
+
+# ---------------------------------------------------------------------------
+# 录制
+# ---------------------------------------------------------------------------
+
+class _SnapshotWriter:
+    def __init__(self):
+        self.records = []
+        self.strings = []
+        self._string_index = {}
+
+    def intern(self, text) -> int:
+        text = "" if text is None else str(text)
+        idx = self._string_index.get(text)
+        if idx is None:
+            idx = len(self.strings)
+            self._string_index[text] = idx
+            self.strings.append(text)
+        return idx
+
+    def add(self, ctrl, parent: int, flags: int = 0, process_name: str = "") -> int:
+        ei = ctrl.element_info
+        rect = getattr(ei, "rectangle", None)
+        try:
+            left, top, right, bottom = int(rect.left), int(rect.top), int(rect.right), int(rect.bottom)
+        except Exception:
+            left = top = right = bottom = 0
+        try:
+            handle = int(getattr(ei, "handle", None) or 0)
+        except Exception:
+            handle = 0
+        self.records.append((
+            parent,
+            flags,
+            self.intern(getattr(ei, "control_type", "")),
+            self.intern(getattr(ei, "class_name", "")),
+            self.intern(getattr(ei, "name", "")),
+            self.intern(process_name),
+            int(getattr(ei, "process_id", None) or 0),
+            handle,
+            left, top, right, bottom,
+        ))
+        return len(self.records) - 1
+
+    def add_tree(self, ctrl, parent: int) -> None:
+        # 用显式栈做先序遍历，避免控件层级过深时递归溢出
+        stack = [(ctrl, parent)]
+        while stack:
+            node, node_parent = stack.pop()
+            try:
+                idx = self.add(node, node_parent)
+            except Exception:
+                continue
+            try:
+                children = node.children()
+            except Exception:
+                children = []
+            for child in reversed(children):
+                stack.append((child, idx))
+
+    def write(self, path: str, meta: dict) -> None:
+        meta_idx = self.intern(json.dumps(meta, ensure_ascii=False))
+        blobs = [s.encode("utf-8") for s in self.strings]
+        offsets = [0]
+        for b in blobs:
+            offsets.append(offsets[-1] + len(b))
+        # "xb"：目标已存在时报错，绝不覆盖已有文件
+        with open(path, "xb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, 0, len(self.records), len(self.strings), meta_idx))
+            for rec in self.records:
+                f.write(_NODE.pack(*rec))
+            f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+            f.write(b"".join(blobs))
+
+
+def record_snapshot(
+    path: str,
+    main_win,
+    top_windows: list,
+    process_name: Callable[[int], str],
+    backend: str = "",
+    label: str = "",
+) -> dict:
+    """录制顶层窗口列表与主窗口的完整控件树，写入 path（不覆盖已有文件）。返回摘要信息。"""
+    writer = _SnapshotWriter()
+    try:
+        main_handle = main_win.wrapper_object().handle
+    except Exception:
+        main_handle = getattr(main_win, "handle", None)
+
+    main_recorded = False
+    for w in top_windows:
+        try:
+            pid = getattr(w.element_info, "process_id", None)
+            is_main = main_handle is not None and w.handle == main_handle
+            flags = FLAG_TOP_WINDOW | (FLAG_MAIN_WINDOW if is_main else 0)
+            idx = writer.add(w, -1, flags, process_name(pid))
+        except Exception:
+            continue
+        if is_main:
+            main_recorded = True
+            _record_children(writer, w, idx)
+
+    if not main_recorded:
+        # 主窗口不在枚举结果中（例如通过标题兜底附着），单独录制
+        wrapper = main_win.wrapper_object()
+        pid = getattr(wrapper.element_info, "process_id", None)
+        idx = writer.add(wrapper, -1, FLAG_TOP_WINDOW | FLAG_MAIN_WINDOW, process_name(pid))
+        _record_children(writer, wrapper, idx)
+
+    meta = {
+        "format": VERSION,
+        "backend": backend,
+        "label": label,
+        "captured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    writer.write(path, meta)
+    return {"path": path, "controls": len(writer.records), "strings": len(writer.strings), "meta": meta}
+
+
+def _record_children(writer: _SnapshotWriter, ctrl, parent: int) -> None:
+    try:
+        children = ctrl.children()
+    except Exception:
+        children = []
+    for child in children:
+        writer.add_tree(child, parent)
+
+
+# ---------------------------------------------------------------------------
+# 回放
+# ---------------------------------------------------------------------------
+
+class SnapshotRect:
+    """与 pywinauto RECT 接口一致的矩形。"""
+
+    __slots__ = ("left", "top", "right", "bottom")
+
+    def __init__(self, left: int, top: int, right: int, bottom: int):
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+
+    def width(self) -> int:
+        return self.right - self.left
+
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    def __repr__(self) -> str:
+        return f"(L{self.left}, T{self.top}, R{self.right}, B{self.bottom})"
+
+
+class SnapshotElementInfo:
+    __slots__ = ("control_type", "class_name", "name", "process_id", "handle", "rectangle")
+
+    def __init__(self, control_type, class_name, name, process_id, handle, rectangle):
+        self.control_type = control_type
+        self.class_name = class_name
+        self.name = name
+        self.process_id = process_id
+        self.handle = handle
+        self.rectangle = rectangle
+
+
+class SnapshotControl:
+    """回放用控件，模拟定位逻辑用到的 pywinauto 包装器方法。"""
+
+    def __init__(self, snapshot: "UISnapshot", index: int):
+        self._snapshot = snapshot
+        self.index = index
+        self._element_info = None
+
+    @property
+    def element_info(self) -> SnapshotElementInfo:
+        if self._element_info is None:
+            self._element_info = self._snapshot._element_info(self.index)
+        return self._element_info
+
+    @property
+    def handle(self):
+        return self.element_info.handle
+
+    def wrapper_object(self):
+        return self
+
+    def children(self, **criteria) -> List["SnapshotControl"]:
+        return self._filter(self._snapshot._children(self.index), criteria)
+
+    def descendants(self, **criteria) -> List["SnapshotControl"]:
+        return self._filter(self._snapshot._descendants(self.index), criteria)
+
+    def _filter(self, indices: List[int], criteria: dict) -> List["SnapshotControl"]:
+        # 只支持下列 pywinauto 过滤条件；其余条件直接报错，避免回放在错误的控件集合上“成功”
+        unsupported = set(criteria) - set(_FILTER_FIELDS) - set(_FILTER_REGEX_FIELDS)
+        if unsupported:
+            raise TypeError(f"快照回放不支持的过滤条件：{', '.join(sorted(unsupported))}")
+        snap = self._snapshot
+        for key, value in criteria.items():
+            if value is None:
+                continue
+            if key in _FILTER_FIELDS:
+                field = _FILTER_FIELDS[key]
+                indices = [i for i in indices if snap._str(i, field) == value]
+            else:
+                pattern = re.compile(value)
+                field = _FILTER_REGEX_FIELDS[key]
+                indices = [i for i in indices if pattern.match(snap._str(i, field))]
+        return [snap.control(i) for i in indices]
+
+    def set_focus(self):
+        self._snapshot.focused = self
+        return self
+
+    def set_keyboard_focus(self):
+        return self.set_focus()
+
+    def is_minimized(self) -> bool:
+        return False
+
+    def describe(self) -> dict:
+        ei = self.element_info
+        r = ei.rectangle
+        return {
+            "index": self.index,
+            "type": ei.control_type,
+            "class": ei.class_name,
+            "name": ei.name,
+            "rect": [r.left, r.top, r.right, r.bottom],
+        }
+
+
+class UISnapshot:
+    """以 mmap 方式打开快照文件，按需解码控件记录。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._string_cache: Dict[int, str] = {}
+        self._controls: Dict[int, SnapshotControl] = {}
+        try:
+            self._parse_header()
+        except Exception:
+            # 截断或损坏的文件同样要释放 mmap 与文件句柄
+            self.close()
+            raise
+
+    def _parse_header(self) -> None:
+        magic, version, _, self.node_count, self.string_count, meta_idx = _HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"不是 UI 快照文件：{self.path}")
+        if version != VERSION:
+            raise ValueError(f"不支持的快照版本：{version}")
+        self._nodes_offset = _HEADER.size
+        self._offsets_offset = self._nodes_offset + self.node_count * _NODE.size
+        self._blob_offset = self._offsets_offset + (self.string_count + 1) * 4
+        self._child_index: Optional[List[List[int]]] = None
+        self._subtree_end: Optional[List[int]] = None
+        self._top_indices: Optional[List[int]] = None
+        self._main_index: Optional[int] = None
+        self._process_names: Optional[Dict[int, str]] = None
+        self.focused: Optional[SnapshotControl] = None
+        self.meta = json.loads(self.string(meta_idx) or "{}")
+
+    def reset_caches(self) -> None:
+        """丢弃已解码的控件与字符串，使下一次定位从冷缓存开始（计时用）。"""
+        self._controls.clear()
+        self._string_cache.clear()
+        self.focused = None
+
+    def close(self) -> None:
+        self._controls.clear()
+        try:
+            self._buf.close()
+        finally:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, idx: int) -> str:
+        s = self._string_cache.get(idx)
+        if s is None:
+            start, end = struct.unpack_from("<II", self._buf, self._offsets_offset + idx * 4)
+            s = self._buf[self._blob_offset + start:self._blob_offset + end].decode("utf-8")
+            self._string_cache[idx] = s
+        return s
+
+    def _record(self, index: int) -> tuple:
+        return _NODE.unpack_from(self._buf, self._nodes_offset + index * _NODE.size)
+
+    def _str(self, index: int, field: int) -> str:
+        return self.string(self._record(index)[field])
+
+    def _element_info(self, index: int) -> SnapshotElementInfo:
+        (_, _, ct, cn, nm, _, pid, handle, left, top, right, bottom) = self._record(index)
+        return SnapshotElementInfo(
+            self.string(ct), self.string(cn), self.string(nm),
+            pid or None, handle or None, SnapshotRect(left, top, right, bottom),
+        )
+
+    def _build_index(self) -> None:
+        children: List[List[int]] = [[] for _ in range(self.node_count)]
+        for i in range(self.node_count):
+            parent = self._record(i)[0]
+            if parent >= 0:
+                children[parent].append(i)
+        # 先序存放，子树为连续区间 [i + 1, subtree_end[i])
+        subtree_end = list(range(1, self.node_count + 1))
+        for i in range(self.node_count - 1, -1, -1):
+            parent = self._record(i)[0]
+            if parent >= 0 and subtree_end[i] > subtree_end[parent]:
+                subtree_end[parent] = subtree_end[i]
+        self._child_index = children
+        self._subtree_end = subtree_end
+
+    def _children(self, index: int) -> List[int]:
+        if self._child_index is None:
+            self._build_index()
+        return self._child_index[index]
+
+    def _descendants(self, index: int) -> List[int]:
+        if self._subtree_end is None:
+            self._build_index()
+        return list(range(index + 1, self._subtree_end[index]))
+
+    def control(self, index: int) -> SnapshotControl:
+        ctrl = self._controls.get(index)
+        if ctrl is None:
+            ctrl = SnapshotControl(self, index)
+            self._controls[index] = ctrl
+        return ctrl
+
+    def _scan_top_windows(self) -> None:
+        # 一次遍历建立顶层窗口列表、主窗口下标与 pid -> 进程名映射
+        top, main, names = [], None, {}
+        for i in range(self.node_count):
+            rec = self._record(i)
+            if not rec[1] & FLAG_TOP_WINDOW:
+                continue
+            top.append(i)
+            if main is None and rec[1] & FLAG_MAIN_WINDOW:
+                main = i
+            if rec[6]:
+                names.setdefault(rec[6], self.string(rec[5]))
+        self._top_indices = top
+        self._main_index = main
+        self._process_names = names
+
+    def top_windows(self) -> List[SnapshotControl]:
+        if self._top_indices is None:
+            self._scan_top_windows()
+        return [self.control(i) for i in self._top_indices]
+
+    def recorded_main_window(self) -> Optional[SnapshotControl]:
+        if self._top_indices is None:
+            self._scan_top_windows()
+        return self.control(self._main_index) if self._main_index is not None else None
+
+    def process_name(self, pid) -> str:
+        if self._process_names is None:
+            self._scan_top_windows()
+        return self._process_names.get(pid, "") if pid else ""
+
+
+def _timed(fn, repeat: int, reset: Callable[[], None]):
+    """重复执行 fn 计时；每次执行前调用 reset 清空解码缓存，保证每次都是冷启动。"""
+    samples = []
+    result = None
+    for _ in range(max(1, repeat)):
+        reset()
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    first = samples[0]
+    samples.sort()
+    return result, {
+        "first_ms": round(first, 3),
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(samples[len(samples) // 2], 3),
+        "max_ms": round(samples[-1], 3),
+    }
+
+
+def replay_snapshot(path: str, repeat: int = 1) -> dict:
+    """对快照运行真实的定位逻辑，返回各定位器选中的控件与耗时。"""
+    ws = _import_sender()
+    with UISnapshot(path) as snap:
+        # 顶层窗口下标与 pid 映射属于快照索引，预先建立；控件对象在每次计时前重建
+        snap.top_windows()
+        snap._build_index()
+        main_win, main_timing = _timed(
+            lambda: ws._find_weixin_main_window(top_windows=snap.top_windows(), process_name=snap.process_name),
+            repeat,
+            snap.reset_caches,
+        )
+        recorded = snap.recorded_main_window()
+        report = {
+            "path": path,
+            "meta": snap.meta,
+            "controls": snap.node_count,
+            "main_window": {
+                "chosen": main_win.describe() if main_win is not None else None,
+                "matches_recorded": main_win is not None and recorded is not None and main_win.index == recorded.index,
+                **main_timing,
+            },
+        }
+        if main_win is None:
+            return report
+
+        main_index = main_win.index
+
+        def _locate(locator):
+            ok = locator(snap.control(main_index))
+            return snap.focused.describe() if ok and snap.focused is not None else None
+
+        for key, locator in (
+            ("message_input", ws._focus_message_input),
+            ("search_edit", ws._try_focus_search_edit),
+        ):
+            chosen, timing = _timed(lambda: _locate(locator), repeat, snap.reset_caches)
+            report[key] = {"chosen": chosen, **timing}
+        return report
+
+
+def _import_sender():
+    try:
+        from script import wechat_sender
+    except ImportError:
+        import wechat_sender
+    return wechat_sender
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="离线回放微信 UI 快照，报告定位结果与耗时")
+    parser.add_argument("paths", nargs="+", help="快照文件或包含 .wxsnap 文件的目录")
+    parser.add_argument("--repeat", type=int, default=20, help="每个定位器重复执行次数（用于计时）")
+    args = parser.parse_args(argv)
+
+    files = []
+    for p in args.paths:
+        if os.path.isdir(p):
+            files.extend(sorted(os.path.join(p, f) for f in os.listdir(p) if f.endswith(".wxsnap")))
+        else:
+            files.append(p)
+
+    reports = []
+    for f in files:
+        try:
+            reports.append(replay_snapshot(f, repeat=args.repeat))
+        except Exception as exc:
+            reports.append({"path": f, "error": str(exc)})
+    json.dump(reports, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()
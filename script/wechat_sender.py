@@ -6,12 +6,20 @@ from typing import List, Optional
 import threading
 import psutil
 
-from pywinauto import Application, keyboard
-from pywinauto import Desktop
-from pywinauto.findwindows import ElementNotFoundError
-from pywinauto.timings import wait_until_passes
-from pywinauto import timings
-from pywinauto import mouse
+try:
+    from pywinauto import Application, keyboard
+    from pywinauto import Desktop
+    from pywinauto.findwindows import ElementNotFoundError
+    from pywinauto.timings import wait_until_passes
+    from pywinauto import timings
+    from pywinauto import mouse
+except ImportError:
+    # 非 Windows 环境（如离线回放 UI 快照）下 pywinauto 不可用，定位逻辑仍可导入；
+    # Windows 上导入失败说明安装有问题，直接抛出真实错误
+    if sys.platform == "win32":
+        raise
+    Application = Desktop = keyboard = mouse = timings = wait_until_passes = None
+    ElementNotFoundError = Exception
 try:
     import pyperclip  # 可选：用于剪贴板粘贴
 except Exception:
@@ -61,6 +69,94 @@ def _window_area(rect) -> int:
         return 0
 
 
+def _foreground_handle() -> Optional[int]:
+    try:
+        import ctypes
+        return ctypes.windll.user32.GetForegroundWindow() or None
+    except Exception:
+        return None
+
+
+class FocusTracker:
+    """记录当前前台窗口与已聚焦的输入控件，只有焦点确实移走时才重新聚焦并等待。
+
+    检查代价很低（GetForegroundWindow + 控件 HasKeyboardFocus），无法确认时一律按
+    失焦处理，行为退化为原来的每次都聚焦。stats 中累计实际执行与省去的聚焦调用和等待时间。
+    """
+
+    def __init__(self):
+        self.window_handle = None
+        self.input_ctrl = None
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.stats = {
+            "focus_calls": 0,
+            "focus_calls_avoided": 0,
+            "settle_seconds": 0.0,
+            "settle_seconds_avoided": 0.0,
+        }
+
+    def invalidate(self) -> None:
+        self.window_handle = None
+        self.input_ctrl = None
+
+    def window_is_foreground(self) -> bool:
+        return self.window_handle is not None and _foreground_handle() == self.window_handle
+
+    def ensure_window(self, wrapper, settle: float, keyboard_focus: bool = True) -> bool:
+        """确保 wrapper 为前台窗口。返回是否真正执行了聚焦。"""
+        keyboard_focus = keyboard_focus and hasattr(wrapper, "set_keyboard_focus")
+        handle = getattr(wrapper, "handle", None)
+        if handle is not None and handle == self.window_handle and self.window_is_foreground():
+            self.count_avoided(2 if keyboard_focus else 1, settle)
+            _log("微信窗口仍在前台，跳过重新聚焦")
+            return False
+        self.input_ctrl = None
+        wrapper.set_focus()
+        self.count(1, 0.0)
+        if keyboard_focus:
+            try:
+                wrapper.set_keyboard_focus()
+                self.count(1, 0.0)
+            except Exception:
+                pass
+        self.count(0, settle)
+        if settle > 0:
+            time.sleep(settle)
+        # 无法读取前台窗口（非 Windows）时不记录，下次仍会重新聚焦
+        self.window_handle = handle if _foreground_handle() is not None else None
+        return True
+
+    def remember_input(self, ctrl) -> None:
+        self.input_ctrl = ctrl
+
+    def input_is_focused(self) -> bool:
+        ctrl = self.input_ctrl
+        if ctrl is None or not self.window_is_foreground():
+            return False
+        try:
+            return bool(ctrl.has_keyboard_focus())
+        except Exception:
+            return False
+
+    def count(self, calls: int, settle: float) -> None:
+        self.stats["focus_calls"] += calls
+        self.stats["settle_seconds"] += settle
+
+    def count_avoided(self, calls: int, settle: float) -> None:
+        self.stats["focus_calls_avoided"] += calls
+        self.stats["settle_seconds_avoided"] += settle
+
+
+FOCUS = FocusTracker()
+
+# 聚焦后的等待时间（秒），FocusTracker 据此统计实际/省去的等待
+INPUT_FOCUS_SETTLE = 0.1  # 聚焦输入框后
+CARET_SETTLE = 0.08  # 发送 {END} 移动光标后
+CLICK_SETTLE = 0.1  # 每次点击聊天区域后
+
+
 def _safe_enum_windows(backend: str, timeout: float = 2.0):
     result = {"windows": None}
 
@@ -79,15 +175,33 @@ def _safe_enum_windows(backend: str, timeout: float = 2.0):
     return result["windows"] or []
 
 
-def _find_weixin_main_window() -> Optional[object]:
-    """在桌面枚举顶层窗口，选择最可能的微信主窗口。返回 WindowSpecification 或 None。"""
+def _enum_top_windows() -> list:
     top_windows = _safe_enum_windows(BACKEND, timeout=2.0)
     if not top_windows:
         # 再尝试另一种 backend 兜底
         alt_backend = "win32" if BACKEND == "uia" else "uia"
         top_windows = _safe_enum_windows(alt_backend, timeout=2.0)
-        if not top_windows:
-            return None
+    return top_windows
+
+
+def _process_name(pid) -> str:
+    try:
+        if pid:
+            return psutil.Process(pid).name() or ""
+    except Exception:
+        pass
+    return ""
+
+
+def _find_weixin_main_window(top_windows=None, process_name=_process_name) -> Optional[object]:
+    """在桌面枚举顶层窗口，选择最可能的微信主窗口。返回 WindowSpecification 或 None。
+
+    top_windows / process_name 可由调用方传入（例如离线回放 UI 快照），默认实时枚举。
+    """
+    if top_windows is None:
+        top_windows = _enum_top_windows()
+    if not top_windows:
+        return None
 
     candidates = []
     for w in top_windows:
@@ -96,12 +210,7 @@ def _find_weixin_main_window() -> Optional[object]:
             name = (ei.name or "")
             class_name = (ei.class_name or "")
             pid = getattr(ei, "process_id", None)
-            proc_name = ""
-            try:
-                if pid:
-                    proc_name = (psutil.Process(pid).name() or "")
-            except Exception:
-                proc_name = ""
+            proc_name = process_name(pid)
             if not any(x in name for x in ("微信", "WeChat", "Weixin")):
                 continue
             # 仅保留微信进程窗口，排除资源管理器等
@@ -219,17 +328,12 @@ def attach_wechat(timeout: float = 20.0):
         if getattr(wrapper, "is_minimized", None) and wrapper.is_minimized():
             _log("正在还原已最小化的窗口 ...")
             wrapper.restore()
+            FOCUS.invalidate()
     except Exception:
         pass
     _log("正在将焦点置于 Weixin 窗口 ...")
-    wrapper.set_focus()
-    try:
-        if hasattr(wrapper, "set_keyboard_focus"):
-            wrapper.set_keyboard_focus()
-    except Exception:
-        pass
-    # Wait a moment to ensure foreground
-    time.sleep(0.3)
+    # Wait a moment to ensure foreground (skipped if it already is)
+    FOCUS.ensure_window(wrapper, settle=0.3)
     return app, main_win
 
 
@@ -253,8 +357,9 @@ def _try_focus_search_edit(main_win) -> bool:
 
 def focus_search_and_open_chat(main_win, friend_name: str, delay: float = 0.25) -> None:
     """聚焦全局搜索（Ctrl+F / Ctrl+K / 直接控件），输入好友名并回车打开聊天。"""
-    main_win.set_focus()
-    time.sleep(0.2)
+    FOCUS.ensure_window(main_win.wrapper_object(), settle=0.2, keyboard_focus=False)
+    # 切换聊天后输入框会变化，之前记录的输入控件作废
+    FOCUS.remember_input(None)
     # Try common shortcuts first
     for combo in ("^f", "^k", "^f"):
         _log(f"发送快捷键 {combo} 以聚焦搜索框 ...")
@@ -279,8 +384,11 @@ def focus_search_and_open_chat(main_win, friend_name: str, delay: float = 0.25)
     time.sleep(delay)
 
 
-def _focus_message_input(main_win) -> bool:
-    """尝试聚焦聊天输入框。返回是否成功。"""
+def _focus_message_input(main_win, stats: Optional[dict] = None):
+    """尝试聚焦聊天输入框。返回聚焦到的控件，失败返回 None。
+
+    不修改全局状态（离线回放也会调用）；传入 stats 时累加实际发起的 set_focus 次数。
+    """
     try:
         ctrls = main_win.descendants()
     except Exception:
@@ -314,7 +422,7 @@ def _focus_message_input(main_win) -> bool:
 
     if not scored:
         _log("未找到候选输入控件")
-        return False
+        return None
 
     scored.sort(key=lambda x: x[0], reverse=True)
     for score, rect, ctrl, ct, cn, nm in scored[:5]:
@@ -322,19 +430,23 @@ def _focus_message_input(main_win) -> bool:
             _log(f"尝试聚焦输入控件 type={ct} class={cn} name={nm}")
             try:
                 ctrl.set_focus()
+                if stats is not None:
+                    stats["focus_calls"] += 1
             except Exception:
                 # 如果 set_focus 失败，尝试点击控件中心
                 x = int((rect.left + rect.right) / 2)
                 y = int((rect.top + rect.bottom) / 2)
                 mouse.click(button='left', coords=(x, y))
-            return True
+            return ctrl
         except Exception:
             continue
     _log("无法聚焦任一输入控件")
-    return False
+    return None
 
 
-def _click_bottom_chat_area(main_win, clicks: int = 3) -> None:
+def _click_bottom_chat_area(main_win, clicks: int = 3) -> int:
+    """点击聊天窗口底部区域，返回实际点击次数（每次点击后等待 CLICK_SETTLE 秒）。"""
+    done = 0
     try:
         rect = main_win.element_info.rectangle
         cx = int((rect.left + rect.right) / 2)
@@ -343,9 +455,11 @@ def _click_bottom_chat_area(main_win, clicks: int = 3) -> None:
             y = int(rect.bottom - 80 - i * 40)
             _log(f"尝试点击聊天窗口底部区域以获取焦点：({cx}, {y})")
             mouse.click(button='left', coords=(cx, y))
-            time.sleep(0.1)
+            time.sleep(CLICK_SETTLE)
+            done += 1
     except Exception:
         pass
+    return done
 
 
 def send_message_to_current_chat(main_win, message: str, delay: float = 0.12, press_enter_to_send: bool = True, use_paste: bool = False) -> None:
@@ -360,22 +474,40 @@ def send_message_to_current_chat(main_win, message: str, delay: float = 0.12, pr
     # 多次尝试聚焦，避免聚焦后又被抢走
     attempts = 3
     for i in range(attempts):
-        focused = _focus_message_input(main_win)
-        if not focused:
-            _click_bottom_chat_area(main_win, clicks=2)
-            time.sleep(0.1)
-            focused = _focus_message_input(main_win)
-        time.sleep(0.1)
-        _log("确保光标在输入框末尾 ...")
-        keyboard.send_keys("{END}")
-        time.sleep(0.08)
-        # 在真正输入前再次尝试设置键盘焦点
-        try:
-            w = main_win.wrapper_object()
-            if hasattr(w, "set_keyboard_focus"):
-                w.set_keyboard_focus()
-        except Exception:
-            pass
+        if FOCUS.input_is_focused():
+            # 上一条消息后输入框仍持有焦点：跳过查找/聚焦输入框（set_focus）、{END}、
+            # 窗口键盘焦点（set_keyboard_focus）及两次等待
+            _log("输入框仍有焦点，跳过重新聚焦")
+            FOCUS.count_avoided(2, INPUT_FOCUS_SETTLE + CARET_SETTLE)
+        else:
+            ctrl = _focus_message_input(main_win, FOCUS.stats)
+            if ctrl is None:
+                clicked = _click_bottom_chat_area(main_win, clicks=2)
+                time.sleep(INPUT_FOCUS_SETTLE)
+                FOCUS.count(0, clicked * CLICK_SETTLE + INPUT_FOCUS_SETTLE)
+                ctrl = _focus_message_input(main_win, FOCUS.stats)
+            time.sleep(INPUT_FOCUS_SETTLE)
+            _log("确保光标在输入框末尾 ...")
+            keyboard.send_keys("{END}")
+            time.sleep(CARET_SETTLE)
+            FOCUS.count(0, INPUT_FOCUS_SETTLE + CARET_SETTLE)
+            # 在真正输入前再次尝试设置键盘焦点
+            try:
+                w = main_win.wrapper_object()
+                if hasattr(w, "set_keyboard_focus"):
+                    w.set_keyboard_focus()
+                    FOCUS.count(1, 0.0)
+            except Exception:
+                pass
+            # 窗口级 set_keyboard_focus 在 UIA 下可能把焦点移到窗口本身；
+            # 只有输入框此刻确实持有键盘焦点时才记录，否则下一条消息照常重新聚焦
+            FOCUS.remember_input(None)
+            if ctrl is not None:
+                try:
+                    if ctrl.has_keyboard_focus():
+                        FOCUS.remember_input(ctrl)
+                except Exception:
+                    pass
 
         # 输入消息（可选用粘贴，降低 IME 干扰概率）
         _log(f"输入消息：{message}")
@@ -423,6 +555,11 @@ def send_messages_to_friends(
                 delay=per_message_pause,
                 press_enter_to_send=press_enter_to_send,
             )
+    st = FOCUS.stats
+    _log(
+        f"聚焦统计：执行 {st['focus_calls']} 次，省去 {st['focus_calls_avoided']} 次；"
+        f"等待 {st['settle_seconds']:.2f}s，省去 {st['settle_seconds_avoided']:.2f}s"
+    )
 
 
 def _parse_cli_args(argv: List[str]):
@@ -471,6 +608,18 @@ def _parse_cli_args(argv: List[str]):
         action="store_true",
         help="仅导出前若干个控件信息到控制台（用于诊断）",
     )
+    parser.add_argument(
+        "--snapshot",
+        type=str,
+        default="",
+        help="把完整控件树录制为二进制快照文件（可离线回放，不覆盖已有文件）；隐含 --dump-controls",
+    )
+    parser.add_argument(
+        "--snapshot-label",
+        type=str,
+        default="",
+        help="快照备注，例如微信版本号或布局说明",
+    )
     parser.add_argument(
         "--backend",
         type=str,
@@ -494,7 +643,9 @@ def _parse_cli_args(argv: List[str]):
         "per_friend_pause": args.friend_delay,
         "per_message_pause": args.message_delay,
         "verbose": args.verbose,
-        "dump_controls": args.dump_controls,
+        "dump_controls": args.dump_controls or bool(args.snapshot),
+        "snapshot": args.snapshot,
+        "snapshot_label": args.snapshot_label,
         "backend": args.backend,
     }
 
@@ -519,6 +670,24 @@ def _dump_some_controls(main_win, limit: int = 50) -> None:
     print("-- 控件导出结束 --")
 
 
+def record_ui_snapshot(main_win, path: str, label: str = "") -> dict:
+    """录制顶层窗口与主窗口完整控件树到快照文件，供 ui_snapshot 离线回放。"""
+    try:
+        from script import ui_snapshot
+    except ImportError:
+        import ui_snapshot
+    info = ui_snapshot.record_snapshot(
+        path,
+        main_win,
+        _enum_top_windows(),
+        _process_name,
+        backend=BACKEND,
+        label=label,
+    )
+    _log(f"已录制 UI 快照：{path}（控件 {info['controls']} 个）")
+    return info
+
+
 def main(argv: Optional[List[str]] = None) -> None:
     if argv is None:
         argv = sys.argv[1:]
@@ -539,6 +708,13 @@ def main(argv: Optional[List[str]] = None) -> None:
         ensure_wechat_running(start_if_needed=True)
         _, main_win = attach_wechat()
         _dump_some_controls(main_win)
+        if cfg.get("snapshot"):
+            try:
+                info = record_ui_snapshot(main_win, cfg["snapshot"], label=cfg.get("snapshot_label", ""))
+            except FileExistsError:
+                print(f"快照文件已存在，未覆盖：{cfg['snapshot']}")
+                return
+            print(f"UI 快照已保存：{info['path']}（控件 {info['controls']} 个）")
         return
 
     send_messages_to_friends(
@@ -1,3 +1,5 @@
+import os
+
 from fastapi import FastAPI
 from pydantic import BaseModel, Field
 from typing import List, Optional
@@ -7,6 +9,12 @@ from script import wechat_sender as ws
 
 app = FastAPI(title="Weixin Auto Sender API", version="2.0")
 
+# /dump 录制的 UI 快照只允许写入该目录
+SNAPSHOT_DIR = os.environ.get(
+    "WEIXIN_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"),
+)
+
 class SendRequest(BaseModel):
     friends: List[str] = Field(..., description="好友/群聊名称列表")
     messages: List[str] = Field(..., description="要发送的消息列表")
@@ -20,12 +28,23 @@ class SendRequest(BaseModel):
 class DumpRequest(BaseModel):
     backend: str = Field("uia", description="后端：uia 或 win32")
     verbose: bool = Field(True, description="中文详细日志")
+    snapshot_name: Optional[str] = Field(None, description="若指定，则把完整控件树录制为快照文件（仅文件名，保存在 WEIXIN_SNAPSHOT_DIR 下，不覆盖已有文件）")
+    snapshot_label: str = Field("", description="快照备注，例如微信版本号")
+
+def _snapshot_path(name: str) -> Optional[str]:
+    """把请求中的快照文件名映射到 SNAPSHOT_DIR 下；含路径成分的名称返回 None。"""
+    if not name or os.path.basename(name) != name or name in (".", "..") or "/" in name or "\\" in name or ":" in name:
+        return None
+    if not name.endswith(".wxsnap"):
+        name += ".wxsnap"
+    return os.path.join(SNAPSHOT_DIR, name)
 
 @app.post("/send")
 async def send_messages(req: SendRequest):
     # Configure globals as the script's CLI would
     ws.BACKEND = req.backend
     ws.VERBOSE = req.verbose
+    ws.FOCUS.reset_stats()
 
     # Ensure running and attach
     ws.ensure_wechat_running(start_if_needed=not req.no_launch)
@@ -42,7 +61,7 @@ async def send_messages(req: SendRequest):
                 delay=req.message_delay,
                 press_enter_to_send=(not req.ctrl_enter),
             )
-    return {"ok": True}
+    return {"ok": True, "focus": dict(ws.FOCUS.stats)}
 
 @app.post("/dump")
 async def dump_controls(req: DumpRequest):
@@ -73,6 +92,18 @@ async def dump_controls(req: DumpRequest):
         if count >= 80:
             break
 
-    return {"ok": True, "controls": out}
+    result = {"ok": True, "controls": out}
+    if req.snapshot_name:
+        path = _snapshot_path(req.snapshot_name)
+        if path is None:
+            return {"ok": False, "error": "invalid_snapshot_name"}
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            result["snapshot"] = ws.record_ui_snapshot(main_win, path, label=req.snapshot_label)
+        except FileExistsError:
+            return {"ok": False, "error": "snapshot_exists"}
+        except Exception as exc:
+            return {"ok": False, "error": "snapshot_failed", "detail": str(exc)}
+    return result
 
 # Run with: uvicorn server:app --host 127.0.0.1 --port 8000